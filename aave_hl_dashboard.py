@@ -1,9 +1,28 @@
 import streamlit as st
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import plotly.graph_objects as go
+from file_cache import FileCache
+
+# Shared HTTP session so pagination batches reuse the same keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.headers.update({'Connection': 'keep-alive'})
+
+# On-disk response caches, with TTLs (seconds) matching each endpoint's data cadence
+_AAVE_CACHE = FileCache('aave')
+_HYPERLIQUID_CACHE = FileCache('hyperliquid')
+AAVE_CACHE_TTL = 6 * 3600
+# The open (trailing) window sits under the 1h st.cache_data on fetch_hyperliquid_funding,
+# so keep its disk TTL short to bound the combined staleness at about 65 minutes
+HYPERLIQUID_CACHE_TTL = 300
+HYPERLIQUID_HISTORY_CACHE_TTL = 30 * 24 * 3600
 
 # AAVE Arbitrum pool
 pools = {
@@ -11,81 +30,216 @@ pools = {
     'weth-v3': 'e302de4d-952e-4e18-9749-0a9dc86e98bc',
 }
 
-# Function to create a DataFrame from the AAVE API response
-def create_df(aave_df):
-    aave_df = pd.DataFrame(aave_df.json()['data'])
+# Columns used from each pool's rate history
+pool_columns = {
+    'usdc-v3': ('timestamp', 'apyBaseBorrow'),
+    'weth-v3': ('timestamp', 'apyBase'),
+}
+
+# Function to create a DataFrame from the AAVE API response payload
+def create_df(aave_data, keep=('timestamp', 'apyBaseBorrow', 'apyBase')):
+    records = aave_data['data']
+    # Only materialize the columns we use; the response carries many more fields
+    aave_df = pd.DataFrame(records, columns=[c for c in keep if not records or c in records[0]])
     aave_df['timestamp'] = pd.to_datetime(aave_df['timestamp'], utc=True)  # Ensure timestamps are in UTC
     aave_df['timestamp'] = aave_df['timestamp'].dt.tz_convert('Asia/Singapore')  # GMT+8 timezone
+    aave_df['timestamp'] = aave_df['timestamp'].dt.tz_localize(None)  # Drop tz info so it lines up with Hyperliquid times
     return aave_df
 
+# Fetch the raw AAVE rates for a pool, going through the on-disk cache
+def fetch_aave_pool(pool_id):
+    def fetch():
+        response = _SESSION.get(f'https://yields.llama.fi/chartLendBorrow/{pool_id}', timeout=10)
+        # Fail loudly: there is no usable frame to build without the pool's rates
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    return _AAVE_CACHE.get_or_fetch(pool_id, AAVE_CACHE_TTL, fetch)
+
 # Fetch data for both pools
 @st.cache_data(ttl=600)
 def fetch_aave_data():
-    aaves = {key: create_df(requests.get(f'https://yields.llama.fi/chartLendBorrow/{value}')) for key, value in pools.items()}
+    # The pools are independent, so fetch them concurrently over the shared session
+    with ThreadPoolExecutor(max_workers=len(pools)) as executor:
+        aaves = dict(zip(pools, executor.map(lambda key: create_df(fetch_aave_pool(pools[key]), keep=pool_columns[key]), pools)))
     return aaves['usdc-v3'], aaves['weth-v3']
 
 # Function to convert datetime to milliseconds since epoch
 def datetime_to_millis(dt):
-    return int(dt.timestamp() * 1000)
+    return int(dt.timestamp()) * 1000 + dt.microsecond // 1000
+
+# Columns kept from the Hyperliquid funding history response
+HYPERLIQUID_COLUMNS = ['time', 'fundingRate', 'annualizedFundingRate']
+
+# Parse a numeric API field, mapping missing or malformed values to NaN like pd.to_numeric(errors='coerce')
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+# Empty funding frame with the expected schema
+def empty_hyperliquid_df():
+    return pd.DataFrame(columns=HYPERLIQUID_COLUMNS).astype({'time': 'datetime64[ns]'})
+
+# Fetch a single [start, end) window of Hyperliquid funding history; raises if the request fails
+def fetch_hyperliquid_batch(coin, start_time_millis, end_time_millis):
+    # Request payload
+    payload = {
+        "type": "fundingHistory",
+        "coin": coin,
+        "startTime": start_time_millis,
+        "endTime": end_time_millis
+    }
+    url = 'https://api.hyperliquid.xyz/info'
+
+    def fetch():
+        response = _SESSION.post(url, json=payload, timeout=10)
+        if response.status_code != 200:
+            print(f"Failed to fetch data: {response.status_code}")
+            # Fail the whole fetch rather than leave a gap in the middle of the history
+            raise RuntimeError(f"Hyperliquid returned {response.status_code} for {coin} {start_time_millis}-{end_time_millis}")
+        return orjson.loads(response.content)
+
+    # Windows that closed more than an hour ago are final, so cache them much longer
+    now_millis = datetime_to_millis(datetime.now(pytz.utc))
+    ttl = HYPERLIQUID_HISTORY_CACHE_TTL if end_time_millis + 3600 * 1000 < now_millis else HYPERLIQUID_CACHE_TTL
+    data = _HYPERLIQUID_CACHE.get_or_fetch([coin, start_time_millis, end_time_millis], ttl, fetch)
+
+    # Build the frame column-wise from typed arrays instead of from the list of dicts
+    n = len(data)
+    times = np.fromiter((d['time'] for d in data), dtype=np.int64, count=n)
+    rates = np.fromiter((to_float(d.get('fundingRate')) for d in data), dtype=np.float64, count=n)
+    batch_df = pd.DataFrame({
+        'time': pd.to_datetime(times, unit='ms'),
+        'fundingRate': rates,
+        'annualizedFundingRate': rates * 24 * 365 * 100
+    })
+    return batch_df
 
 # Hyperliquid API function with pagination and controlled request size
+@st.cache_data(ttl=3600, show_spinner=False)
 def fetch_hyperliquid_funding(coin="ETH", days=7, hours_per_request=500):
-    final_df = pd.DataFrame()
     tz = pytz.timezone('Asia/Singapore')
     # Set the end time as now in GMT+8
     end_time = datetime.now(tz).replace(hour=7, minute=0, second=0, microsecond=0)
     start_time = end_time - timedelta(days=days)
-    
-    current_start_time = start_time
-    while current_start_time < end_time:
-        current_end_time = min(current_start_time + timedelta(hours=hours_per_request), end_time)
-        start_time_millis = datetime_to_millis(current_start_time)
-        end_time_millis = datetime_to_millis(current_end_time)
-        
-        # Request payload
-        payload = {
-            "type": "fundingHistory",
-            "coin": coin,
-            "startTime": start_time_millis,
-            "endTime": end_time_millis
-        }
-        url = 'https://api.hyperliquid.xyz/info'
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            data = response.json()
-            batch_df = pd.DataFrame(data)
-            batch_df['time'] = pd.to_datetime(batch_df['time'], unit='ms')
-            batch_df['fundingRate'] = pd.to_numeric(batch_df['fundingRate'], errors='coerce')
-            batch_df['annualizedFundingRate'] = batch_df['fundingRate'] * 24 * 365 * 100
-            final_df = pd.concat([final_df, batch_df], ignore_index=True)
-        else:
-            print(f"Failed to fetch data: {response.status_code}")
-            break
-        current_start_time = current_end_time
 
+    # Precompute the request windows in integer milliseconds so they can be fetched concurrently.
+    # Windows sit on a fixed epoch grid of step_millis, so a closed window keeps the same
+    # cache key across days and `days` values; the result is trimmed to [start, end) below.
+    start_time_millis = datetime_to_millis(start_time)
+    end_time_millis = datetime_to_millis(end_time)
+    step_millis = hours_per_request * 3600 * 1000
+    grid_start_millis = start_time_millis - start_time_millis % step_millis
+    windows = [(current_start_millis, current_start_millis + step_millis)
+               for current_start_millis in range(grid_start_millis, end_time_millis, step_millis)]
+
+    # A failed window raises out of executor.map, so a partial frame is never returned or cached
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(lambda window: fetch_hyperliquid_batch(coin, *window), windows))
+
+    # Concatenate once at the end; keep the schema even when no batches came back
+    final_df = pd.concat(batches, ignore_index=True) if batches else empty_hyperliquid_df()
+
+    # Trim the grid-aligned windows back to the requested range; adjacent windows share their boundary row
+    in_range = ((final_df['time'] >= pd.to_datetime(start_time_millis, unit='ms'))
+                & (final_df['time'] < pd.to_datetime(end_time_millis, unit='ms')))
+    final_df = final_df[in_range].drop_duplicates('time', ignore_index=True)
     return final_df
 
+# Function to convert a tz-naive datetime column to int64 nanoseconds since epoch
+def to_int64_ns(series):
+    return series.to_numpy(dtype='datetime64[ns]').view('i8')
+
+# Backward as-of lookup: for each left timestamp take the last right value at or before it (NaN if none)
+def asof_backward(left_ts, right_ts, right_values):
+    out = np.full(len(left_ts), np.nan)
+    if len(right_ts) == 0:
+        return out
+    idx = np.searchsorted(right_ts, left_ts, side='right') - 1
+    matched = idx >= 0
+    out[matched] = right_values[idx[matched]]
+    return out
+
+# Sort by column only when it is not already ascending (API responses usually are)
+def sort_if_needed(df, column):
+    if df[column].is_monotonic_increasing:
+        return df
+    return df.sort_values(column)
+
 # Function to merge Hyperliquid and AAVE data on timestamp
 def merge_data(hyperliquid_df, usdc_df, weth_df):
-    # Ensure both AAVE and Hyperliquid timestamps are in UTC without timezones
-    usdc_df['timestamp'] = usdc_df['timestamp'].dt.tz_localize(None)
-    weth_df['timestamp'] = weth_df['timestamp'].dt.tz_localize(None)
-    
-    # Merge the funding data with the USDC borrow and WETH lend rates
-    merged_df = pd.merge_asof(hyperliquid_df.sort_values('time'), usdc_df[['timestamp', 'apyBaseBorrow']].sort_values('timestamp'),
-                              left_on='time', right_on='timestamp', direction='backward')
-    merged_df = pd.merge_asof(merged_df, weth_df[['timestamp', 'apyBase']].sort_values('timestamp'),
-                              left_on='time', right_on='timestamp', direction='backward')
-
-    # Rename columns for clarity
-    merged_df = merged_df.rename(columns={'apyBaseBorrow': 'usdc_borrow_rate', 'apyBase': 'weth_lend_rate'})
-    
-    # Drop the extra 'timestamp' columns from the merges
-    merged_df = merged_df.drop(columns=['timestamp_x', 'timestamp_y'])
+    # Look up the USDC borrow and WETH lend rates in effect at each funding timestamp
+    usdc = sort_if_needed(usdc_df[['timestamp', 'apyBaseBorrow']], 'timestamp')
+    weth = sort_if_needed(weth_df[['timestamp', 'apyBase']], 'timestamp')
+    merged_df = sort_if_needed(hyperliquid_df, 'time').reset_index(drop=True)
+    left_ts = to_int64_ns(merged_df['time'])
+    merged_df['usdc_borrow_rate'] = asof_backward(left_ts, to_int64_ns(usdc['timestamp']), usdc['apyBaseBorrow'].to_numpy(dtype='float64'))
+    merged_df['weth_lend_rate'] = asof_backward(left_ts, to_int64_ns(weth['timestamp']), weth['apyBase'].to_numpy(dtype='float64'))
 
     return merged_df
 
+# Upper bound on points sent to the browser per chart for long histories
+MAX_PLOT_POINTS = 1000
+
+# Keep every n-th row so the frame has at most max_pts rows
+def downsample(df, max_pts=MAX_PLOT_POINTS):
+    step = max(1, -(-len(df) // max_pts))
+    return df.iloc[::step]
+
+# Largest-Triangle-Three-Buckets: pick max_pts indices that best preserve the visual shape of the line
+def lttb_indices(x, y, max_pts=MAX_PLOT_POINTS):
+    n = len(x)
+    if max_pts >= n or max_pts < 3:
+        return np.arange(n)
+    bucket_size = (n - 2) / (max_pts - 2)
+    indices = np.empty(max_pts, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(max_pts - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        # Average of the next bucket is the third vertex of the triangle
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        indices[i + 1] = a
+    return indices
+
+# Layout shared by all line charts
+_BASE_LAYOUT = dict(xaxis=dict(title=dict(text='Time')), margin=dict(l=40, r=10, t=40, b=30))
+
+# Build a single-trace WebGL line chart in one Figure construction on top of the shared layout
+def line_figure(x, y, name, color, title, yaxis_title):
+    return go.Figure({
+        'data': [{'type': 'scattergl', 'x': x, 'y': y, 'mode': 'lines', 'name': name, 'line': {'color': color}}],
+        'layout': {**_BASE_LAYOUT, 'title': {'text': title}, 'yaxis': {'title': {'text': yaxis_title}}}
+    })
+
+# Styles for the statistics row
+_STATIC_CSS = """
+<style>
+.stat-container {
+    display: flex;
+    justify-content: space-around;
+    padding: 20px 0;
+}
+.stat {
+    text-align: center;
+    font-size: 24px;
+    font-weight: bold;
+    margin: 10px;
+}
+.stat-label {
+    font-size: 14px;
+    color: grey;
+}
+</style>
+"""
+
 # Fetching and processing data
 st.title("Aave-HL Arb Dashboard")
 
@@ -102,7 +256,11 @@ with col4:
 
 # Main Execution
 # Fetch Hyperliquid funding data
-hyperliquid_df = fetch_hyperliquid_funding(coin="ETH", days=days, hours_per_request=500)
+try:
+    hyperliquid_df = fetch_hyperliquid_funding(coin="ETH", days=days, hours_per_request=500)
+except (requests.RequestException, RuntimeError) as e:
+    st.error(f"Failed to fetch Hyperliquid funding data: {e}")
+    hyperliquid_df = empty_hyperliquid_df()
 
 # Fetch AAVE data for USDC and WETH
 usdc_df, weth_df = fetch_aave_data()
@@ -110,41 +268,30 @@ usdc_df, weth_df = fetch_aave_data()
 # Merge Hyperliquid data with AAVE data based on timestamps
 merged_df = merge_data(hyperliquid_df, usdc_df, weth_df)
 
-# Adjust usdc_borrow_rate and weth_lend_rate based on Leverage and LTV
-merged_df['adjusted_usdc_borrow_rate'] = merged_df['usdc_borrow_rate'] * leverage * ltv
-merged_df['adjusted_weth_lend_rate'] = merged_df['weth_lend_rate'] * leverage
-merged_df['annualizedFundingRate'] = merged_df['annualizedFundingRate'] * leverage
+# Adjust usdc_borrow_rate and weth_lend_rate based on Leverage and LTV, working on the raw arrays
+funding_rate = merged_df['annualizedFundingRate'].to_numpy(dtype='float64') * leverage
+weth_lend_rate = merged_df['weth_lend_rate'].to_numpy(dtype='float64') * leverage
+usdc_borrow_rate = merged_df['usdc_borrow_rate'].to_numpy(dtype='float64') * (leverage * ltv)
 
 # Calculate arb_return using adjusted rates
-merged_df['arb_return'] = merged_df['annualizedFundingRate'] + merged_df['adjusted_weth_lend_rate'] - merged_df['adjusted_usdc_borrow_rate']
+arb_return = funding_rate + weth_lend_rate - usdc_borrow_rate
+
+# Assign back the columns used by the charts
+merged_df['annualizedFundingRate'] = funding_rate
+merged_df['adjusted_weth_lend_rate'] = weth_lend_rate
+merged_df['adjusted_usdc_borrow_rate'] = usdc_borrow_rate
+merged_df['arb_return'] = arb_return
 
 # Display statistics
 if not merged_df.empty:
-    hyperliquid_avg = merged_df['annualizedFundingRate'].mean()
-    adjusted_weth_lend_avg = merged_df['adjusted_weth_lend_rate'].mean()
-    adjusted_usdc_borrow_avg = merged_df['adjusted_usdc_borrow_rate'].mean()
-    arb = merged_df['arb_return'].mean()
+    # nanmean matches pandas' mean(), which skips rows before the first AAVE sample
+    hyperliquid_avg = np.nanmean(funding_rate)
+    adjusted_weth_lend_avg = np.nanmean(weth_lend_rate)
+    adjusted_usdc_borrow_avg = np.nanmean(usdc_borrow_rate)
+    arb = np.nanmean(arb_return)
 
     # Display statistics in a styled format
-    st.markdown("""
-    <style>
-    .stat-container {
-        display: flex;
-        justify-content: space-around;
-        padding: 20px 0;
-    }
-    .stat {
-        text-align: center;
-        font-size: 24px;
-        font-weight: bold;
-        margin: 10px;
-    }
-    .stat-label {
-        font-size: 14px;
-        color: grey;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_STATIC_CSS, unsafe_allow_html=True)
 
     st.markdown(f"""
     <div class="stat-container">
@@ -167,32 +314,32 @@ if not merged_df.empty:
     </div>
     """, unsafe_allow_html=True)
 
+    # Thin out long histories before plotting; the statistics above still use every row
+    plot_df = merged_df
+    arb_plot_df = merged_df
+    if days > 30:
+        plot_df = downsample(merged_df)
+        arb_plot_df = merged_df.iloc[lttb_indices(to_int64_ns(merged_df['time']).astype('float64'),
+                                                  merged_df['arb_return'].to_numpy(dtype='float64'))]
+
     # Plot Arb Return
-    fig_arb = go.Figure()
-    fig_arb.add_trace(go.Scatter(x=merged_df['time'], y=merged_df['arb_return'],
-                                  mode='lines', name='Arb Return', line=dict(color='#FF0000')))
-    fig_arb.update_layout(title='Arb Return', xaxis_title='Time', yaxis_title='Arb Return (%)')
+    fig_arb = line_figure(arb_plot_df['time'], arb_plot_df['arb_return'], 'Arb Return', '#FF0000',
+                          'Arb Return', 'Arb Return (%)')
     st.plotly_chart(fig_arb, use_container_width=True)
 
     # Plot Hyperliquid funding rate
-    fig_hyperliquid = go.Figure()
-    fig_hyperliquid.add_trace(go.Scatter(x=merged_df['time'], y=merged_df['annualizedFundingRate'],
-                                         mode='lines', name='Hyperliquid', line=dict(color='#00BFFF')))
-    fig_hyperliquid.update_layout(title='Hyperliquid Annualized Funding Rate', xaxis_title='Time', yaxis_title='Annualized Funding Rate (%)')
+    fig_hyperliquid = line_figure(plot_df['time'], plot_df['annualizedFundingRate'], 'Hyperliquid', '#00BFFF',
+                                  'Hyperliquid Annualized Funding Rate', 'Annualized Funding Rate (%)')
     st.plotly_chart(fig_hyperliquid, use_container_width=True)
 
     # Plot Adjusted USDC Borrow Rate
-    fig_usdc = go.Figure()
-    fig_usdc.add_trace(go.Scatter(x=merged_df['time'], y=merged_df['adjusted_usdc_borrow_rate'],
-                                      mode='lines', name='USDC Borrow Rate', line=dict(color='#4682B4')))
-    fig_usdc.update_layout(title='USDC Borrow Rate', xaxis_title='Time', yaxis_title='Annualized Borrow Rate (%)')
+    fig_usdc = line_figure(plot_df['time'], plot_df['adjusted_usdc_borrow_rate'], 'USDC Borrow Rate', '#4682B4',
+                           'USDC Borrow Rate', 'Annualized Borrow Rate (%)')
     st.plotly_chart(fig_usdc, use_container_width=True)
 
     # Plot Adjusted WETH Lending Rate
-    fig_weth = go.Figure()
-    fig_weth.add_trace(go.Scatter(x=merged_df['time'], y=merged_df['adjusted_weth_lend_rate'],
-                                      mode='lines', name='WETH Lending Rate', line=dict(color='#4682B4')))
-    fig_weth.update_layout(title='WETH Lending Rate', xaxis_title='Time', yaxis_title='Annualized Lending Rate (%)')
+    fig_weth = line_figure(plot_df['time'], plot_df['adjusted_weth_lend_rate'], 'WETH Lending Rate', '#4682B4',
+                           'WETH Lending Rate', 'Annualized Lending Rate (%)')
     st.plotly_chart(fig_weth, use_container_width=True)
 
 else:
@@ -1,10 +1,20 @@
 import streamlit as st
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import plotly.graph_objects as go
 import warnings
+import time
+
+# Shared HTTP session so pagination batches reuse the same keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.headers.update({'Connection': 'keep-alive'})
 
 # Suppress specific warning
 warnings.filterwarnings("ignore", category=FutureWarning, module='_plotly_utils.basevalidators')
@@ -15,61 +25,136 @@ def convert_to_gmt8(df, column):
     df[column] = df[column].dt.tz_localize('UTC').dt.tz_convert(tz)
     return df
 
+# Columns kept from the Hyperliquid funding history response
+HYPERLIQUID_COLUMNS = ['time', 'fundingRate', 'annualizedFundingRate']
+
+# Parse a numeric API field, mapping missing or malformed values to NaN like pd.to_numeric(errors='coerce')
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+# Empty funding frame with the expected schema
+def empty_hyperliquid_df():
+    return pd.DataFrame(columns=HYPERLIQUID_COLUMNS).astype({'time': 'datetime64[ns]'})
+
+# Fetch a single [start, end) window of Hyperliquid funding history; raises if the request fails
+def fetch_hyperliquid_batch(coin, start_time_millis, end_time_millis):
+    payload = {"type": "fundingHistory", "coin": coin, "startTime": start_time_millis, "endTime": end_time_millis}
+    url = 'https://api.hyperliquid.xyz/info'
+    response = _SESSION.post(url, json=payload, timeout=10)
+
+    if response.status_code != 200:
+        # Log error instead of displaying
+        print(f"Failed to fetch data: {response.status_code}")
+        print(response.text)  # Log the response content for debugging
+        # Fail the whole fetch rather than leave a gap in the middle of the history
+        raise RuntimeError(f"Hyperliquid returned {response.status_code} for {coin} {start_time_millis}-{end_time_millis}")
+
+    data = orjson.loads(response.content)
+    # Build the frame column-wise from typed arrays instead of from the list of dicts
+    n = len(data)
+    times = np.fromiter((d['time'] for d in data), dtype=np.int64, count=n)
+    rates = np.fromiter((to_float(d.get('fundingRate')) for d in data), dtype=np.float64, count=n)
+    batch_df = pd.DataFrame({
+        'time': pd.to_datetime(times, unit='ms'),
+        'fundingRate': rates,
+        'annualizedFundingRate': rates * 24 * 365 * 100
+    })
+    return batch_df
+
 # Hyperliquid API function
+@st.cache_data(ttl=3600, show_spinner=False)
 def fetch_hyperliquid_funding(coin="BTC", days=7, hours_per_request=500):
-    final_df = pd.DataFrame()
     end_time = datetime.now()
     start_time = end_time - timedelta(days=days)
-    current_start_time = start_time
-
-    while current_start_time < end_time:
-        current_end_time = min(current_start_time + timedelta(hours=hours_per_request), end_time)
-        start_time_millis = int(current_start_time.timestamp() * 1000)
-        end_time_millis = int(current_end_time.timestamp() * 1000)
-        payload = {"type": "fundingHistory", "coin": coin, "startTime": start_time_millis, "endTime": end_time_millis}
-        url = 'https://api.hyperliquid.xyz/info'
-        response = requests.post(url, json=payload)
-
-        if response.status_code == 200:
-            data = response.json()
-            batch_df = pd.DataFrame(data)
-            batch_df['time'] = pd.to_datetime(batch_df['time'], unit='ms')
-            batch_df['fundingRate'] = pd.to_numeric(batch_df['fundingRate'], errors='coerce')
-            batch_df['annualizedFundingRate'] = batch_df['fundingRate'] * 24 * 365 * 100
-            final_df = pd.concat([final_df, batch_df], ignore_index=True)
-        else:
-            # Log error instead of displaying
-            print(f"Failed to fetch data: {response.status_code}")
-            print(response.text)  # Log the response content for debugging
-            break
-        current_start_time = current_end_time
 
+    # Precompute the request windows in integer milliseconds so they can be fetched concurrently
+    end_time_millis = int(end_time.timestamp() * 1000)
+    step_millis = hours_per_request * 3600 * 1000
+    windows = [(current_start_millis, min(current_start_millis + step_millis, end_time_millis))
+               for current_start_millis in range(int(start_time.timestamp() * 1000), end_time_millis, step_millis)]
+
+    # A failed window raises out of executor.map, so a partial frame is never returned or cached
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(lambda window: fetch_hyperliquid_batch(coin, *window), windows))
+
+    # Concatenate once at the end; keep the schema even when no batches came back
+    final_df = pd.concat(batches, ignore_index=True) if batches else empty_hyperliquid_df()
     final_df = convert_to_gmt8(final_df, 'time')  # Convert timezone to GMT+8
     return final_df
 
+# Maximum rows Bitfinex returns per status history request
+BITFINEX_LIMIT = 5000
+
+# Bitfinex's public history endpoint is rate limited, so keep concurrency low and retry with backoff
+BITFINEX_MAX_WORKERS = 3
+BITFINEX_MAX_RETRIES = 4
+BITFINEX_MAX_RETRY_DELAY = 30  # Upper bound (seconds) on a server-requested Retry-After, since it blocks the script run
+
+# Fetch one page of Bitfinex derivative status history, retrying rate limits (429) and server errors.
+# Raises RuntimeError once retries are exhausted so a failed page never leaves a silent gap.
+def fetch_bitfinex_page(url, start_time, end_time):
+    headers = {"accept": "application/json"}
+    params = {"start": start_time, "end": end_time, "sort": 1, "limit": BITFINEX_LIMIT}
+
+    for attempt in range(BITFINEX_MAX_RETRIES + 1):
+        delay = 2 ** attempt
+        try:
+            response = _SESSION.get(url, headers=headers, params=params, timeout=10)
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            error = f"{response.status_code} {response.text}"
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = min(int(retry_after), BITFINEX_MAX_RETRY_DELAY)
+        # Log error instead of displaying
+        print(f"Failed to retrieve data (attempt {attempt + 1}): {error}")
+        if attempt < BITFINEX_MAX_RETRIES:
+            time.sleep(delay)
+
+    raise RuntimeError(f"Failed to retrieve Bitfinex data for {start_time}-{end_time}: {error}")
+
+# Fetch every row in [start_time, end_time], following the cursor while pages come back full
+def fetch_bitfinex_window(url, start_time, end_time):
+    rows = []
+    while start_time <= end_time:
+        data = fetch_bitfinex_page(url, start_time, end_time)
+        if not data:
+            break
+        rows.extend(data)
+        if len(data) < BITFINEX_LIMIT:
+            break
+        start_time = data[-1][0] + 1
+    return rows
+
 # Bitfinex API function
 def fetch_bitfinex_funding(coin="tBTCF0:USTF0", days=7):
     url = f"https://api-pub.bitfinex.com/v2/status/deriv/{coin}/hist"
     end_time = int(datetime.now().timestamp() * 1000)
     start_time = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
-    all_data = []
-    headers = {"accept": "application/json"}
-
-    while True:
-        params = {"start": start_time, "end": end_time, "sort": 1, "limit": 5000}
-        response = requests.get(url, headers=headers, params=params)
 
-        if response.status_code == 200:
-            data = response.json()
-            if not data:
-                break
-            all_data.extend(data)
-            start_time = data[-1][0] + 1
-        else:
-            # Log error instead of displaying
-            print(f"Failed to retrieve data: {response.status_code}")
-            print(response.text)  # Log the response content for debugging
-            break
+    # Probe the first page to estimate how much time one page of rows covers
+    all_data = fetch_bitfinex_page(url, start_time, end_time)
+    if len(all_data) == BITFINEX_LIMIT:
+        # Split the rest of the range into windows that should each fit in about one page,
+        # and fetch them concurrently; windows that still overflow follow their own cursor
+        window_millis = max(int((all_data[-1][0] - all_data[0][0]) * 0.9), 1)
+        windows = [(window_start, min(window_start + window_millis - 1, end_time))
+                   for window_start in range(all_data[-1][0] + 1, end_time + 1, window_millis)]
+        executor = ThreadPoolExecutor(max_workers=BITFINEX_MAX_WORKERS)
+        try:
+            for rows in executor.map(lambda window: fetch_bitfinex_window(url, *window), windows):
+                all_data.extend(rows)
+        finally:
+            # On failure, drop the queued windows instead of spending more rate limit on them
+            executor.shutdown(cancel_futures=True)
 
     df = pd.DataFrame(all_data, columns=[
         "MTS", "NULL_1", "DERIV_PRICE", "SPOT_PRICE", "NULL_2", "INSURANCE_FUND_BALANCE", 
@@ -77,6 +162,7 @@ def fetch_bitfinex_funding(coin="tBTCF0:USTF0", days=7):
         "NULL_4", "CURRENT_FUNDING", "NULL_5", "NULL_6", "MARK_PRICE", "NULL_7", 
         "NULL_8", "OPEN_INTEREST", "NULL_9", "NULL_10", "NULL_11", "CLAMP_MIN", "CLAMP_MAX"
     ])
+    df = df.drop_duplicates('MTS')  # Guard against rows repeated across window boundaries
 
     df['MTS'] = pd.to_datetime(df['MTS'], unit='ms')
     df['NEXT_FUNDING_EVT_MTS'] = pd.to_datetime(df['NEXT_FUNDING_EVT_MTS'], unit='ms')
@@ -84,7 +170,7 @@ def fetch_bitfinex_funding(coin="tBTCF0:USTF0", days=7):
              "NEXT_FUNDING_EVT_MTS", "NEXT_FUNDING_ACCRUED", "CURRENT_FUNDING", 
              "MARK_PRICE", "OPEN_INTEREST", "CLAMP_MIN", "CLAMP_MAX"]]
 
-    df['Hour'] = df['MTS'].apply(lambda row: row.replace(minute=0, second=0, microsecond=0))
+    df['Hour'] = df['MTS'].dt.floor('h')
     grouped = df.groupby('Hour').agg(['first', 'last']).reset_index()
     grouped.columns = grouped.columns.map('_'.join).str.strip('_')
     grouped = grouped[['Hour', 'MTS_first', 'CURRENT_FUNDING_first', 'MTS_last', 'CURRENT_FUNDING_last']]
@@ -102,6 +188,27 @@ def fetch_bitfinex_funding(coin="tBTCF0:USTF0", days=7):
     grouped = convert_to_gmt8(grouped, 'Hour Interval')  # Convert timezone to GMT+8
     return grouped
 
+# Styles for the statistics row
+_STATIC_CSS = """
+<style>
+.stat-container {
+    display: flex;
+    justify-content: space-around;
+    padding: 20px 0;
+}
+.stat {
+    text-align: center;
+    font-size: 24px;
+    font-weight: bold;
+    margin: 10px;
+}
+.stat-label {
+    font-size: 14px;
+    color: grey;
+}
+</style>
+"""
+
 # Title
 st.title("Funding Rate Dashboard")
 
@@ -113,8 +220,16 @@ with col2:
     days = st.slider("Select Days", min_value=1, max_value=90, value=7, key='days')
 
 # Fetch data
-hyperliquid_df = fetch_hyperliquid_funding(coin=coin, days=days)
-bitfinex_df = fetch_bitfinex_funding(coin=f"t{coin}F0:USTF0", days=days)
+try:
+    hyperliquid_df = fetch_hyperliquid_funding(coin=coin, days=days)
+except (requests.RequestException, RuntimeError) as e:
+    st.error(f"Failed to fetch Hyperliquid funding data: {e}")
+    hyperliquid_df = empty_hyperliquid_df()
+try:
+    bitfinex_df = fetch_bitfinex_funding(coin=f"t{coin}F0:USTF0", days=days)
+except RuntimeError as e:
+    st.error(f"Failed to fetch Bitfinex funding data: {e}")
+    bitfinex_df = pd.DataFrame()
 
 # Calculate differences
 if not hyperliquid_df.empty and not bitfinex_df.empty:
@@ -123,25 +238,7 @@ if not hyperliquid_df.empty and not bitfinex_df.empty:
     difference = hyperliquid_avg - bitfinex_avg
 
     # Display statistics in a styled format
-    st.markdown("""
-    <style>
-    .stat-container {
-        display: flex;
-        justify-content: space-around;
-        padding: 20px 0;
-    }
-    .stat {
-        text-align: center;
-        font-size: 24px;
-        font-weight: bold;
-        margin: 10px;
-    }
-    .stat-label {
-        font-size: 14px;
-        color: grey;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_STATIC_CSS, unsafe_allow_html=True)
 
     st.markdown(f"""
     <div class="stat-container">
@@ -167,21 +264,21 @@ if not hyperliquid_df.empty and not bitfinex_df.empty:
 
     # Plot funding rate difference
     fig_diff = go.Figure()
-    fig_diff.add_trace(go.Scatter(x=combined_df['time'], y=combined_df['Funding Rate Difference'],
+    fig_diff.add_trace(go.Scattergl(x=combined_df['time'], y=combined_df['Funding Rate Difference'],
                                   mode='lines', name='Funding Rate Difference', line=dict(color='#FF0000')))
     fig_diff.update_layout(title='Funding Rate Difference (Hyperliquid - Bitfinex)', xaxis_title='Time', yaxis_title='Funding Rate Difference')
     st.plotly_chart(fig_diff, use_container_width=True)
 
     # Plot Hyperliquid funding rate
     fig_hyperliquid = go.Figure()
-    fig_hyperliquid.add_trace(go.Scatter(x=hyperliquid_df['time'], y=hyperliquid_df['annualizedFundingRate'],
+    fig_hyperliquid.add_trace(go.Scattergl(x=hyperliquid_df['time'], y=hyperliquid_df['annualizedFundingRate'],
                                          mode='lines', name='Hyperliquid', line=dict(color='#00BFFF')))
     fig_hyperliquid.update_layout(title='Hyperliquid Annualized Funding Rate', xaxis_title='Time', yaxis_title='Annualized Funding Rate')
     st.plotly_chart(fig_hyperliquid, use_container_width=True)
 
     # Plot Bitfinex funding rate
     fig_bitfinex = go.Figure()
-    fig_bitfinex.add_trace(go.Scatter(x=bitfinex_df['Hour Interval'], y=bitfinex_df['Annualized Funding Rate'],
+    fig_bitfinex.add_trace(go.Scattergl(x=bitfinex_df['Hour Interval'], y=bitfinex_df['Annualized Funding Rate'],
                                       mode='lines', name='Bitfinex', line=dict(color='#4682B4')))
     fig_bitfinex.update_layout(title='Bitfinex Annualized Funding Rate', xaxis_title='Time', yaxis_title='Annualized Funding Rate')
     st.plotly_chart(fig_bitfinex, use_container_width=True)
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import tempfile
+import time
+
+import orjson
+
+# Cache directory next to the dashboards, independent of the directory streamlit is launched from
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+# How often set() sweeps the endpoint directory for expired entries (seconds)
+PRUNE_INTERVAL = 3600
+
+# Small on-disk JSON cache so API responses survive Streamlit process restarts.
+# Entries live in .cache/<endpoint>/<md5(key)>.json as {"ts": ..., "ttl": ..., "payload": ...}
+class FileCache:
+    def __init__(self, endpoint, root=CACHE_ROOT):
+        self.directory = os.path.join(root, endpoint)
+        self._last_prune = 0.0
+
+    def _path(self, key):
+        digest = hashlib.md5(orjson.dumps(key, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json')
+
+    # Return the payload stored at path if still fresh; expired or unreadable entries are deleted
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                envelope = orjson.loads(f.read())
+            if time.time() - envelope['ts'] < envelope['ttl']:
+                return envelope['payload']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    def get(self, key):
+        return self._read(self._path(key))
+
+    # Best effort: an unwritable cache directory (read-only deploy, bad root) only skips caching
+    def set(self, key, ttl, payload):
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temp file first so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps({'ts': time.time(), 'ttl': ttl, 'payload': payload}))
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if time.time() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+    # Delete every expired or unreadable entry, including ones whose key is never looked up again
+    def prune(self):
+        self._last_prune = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                self._read(os.path.join(self.directory, name))
+
+    # Return the cached payload if still fresh, otherwise call fetcher and store its result.
+    # A fetcher returning None (failed request) is not cached.
+    def get_or_fetch(self, key, ttl, fetcher):
+        payload = self.get(key)
+        if payload is not None:
+            return payload
+        payload = fetcher()
+        if payload is not None:
+            self.set(key, ttl, payload)
+        return payload
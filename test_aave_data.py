@@ -1,10 +1,17 @@
 import streamlit as st
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
 import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 import plotly.graph_objects as go
 
+# Shared HTTP session so both pool requests reuse the same keep-alive connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_SESSION.headers.update({'Connection': 'keep-alive'})
+
 # AAVE Arbitrum pool
 pools = {
     'usdc-v3': 'd9fa8e14-0447-4207-9ae8-7810199dfa1f',
@@ -13,18 +20,17 @@ pools = {
 
 # Function to create a DataFrame from the AAVE API response
 def create_df(aave_df):
-    aave_df = pd.DataFrame(aave_df.json()['data'])
+    aave_df = pd.DataFrame(orjson.loads(aave_df.content)['data'])
     aave_df['timestamp'] = pd.to_datetime(aave_df['timestamp'], utc=True)  # Ensure timestamps are in UTC
     aave_df['timestamp'] = aave_df['timestamp'].dt.tz_convert('Asia/Singapore')  # GMT+8 timezone
+    aave_df['timestamp'] = aave_df['timestamp'].dt.tz_localize(None)  # Drop tz info so it lines up with Hyperliquid times
     return aave_df
 
 def fetch_aave_data():
-    aaves = {key: create_df(requests.get(f'https://yields.llama.fi/chartLendBorrow/{value}')) for key, value in pools.items()}
+    aaves = {key: create_df(_SESSION.get(f'https://yields.llama.fi/chartLendBorrow/{value}')) for key, value in pools.items()}
     return aaves['usdc-v3'], aaves['weth-v3']
 
 usdc_df, weth_df = fetch_aave_data()
-usdc_df['timestamp'] = usdc_df['timestamp'].dt.tz_localize(None)
-weth_df['timestamp'] = weth_df['timestamp'].dt.tz_localize(None)
 
 
 print(usdc_df[['timestamp', 'apyBaseBorrow']])
\ No newline at end of file